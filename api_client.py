@@ -13,6 +13,27 @@ from typing import Optional, Dict, Any
 from dataclasses import dataclass
 
 
+# Haar cascade for cropping uploads, parsed from XML once on first use
+_face_cascade = None
+
+
+def _get_face_cascade():
+    """Get or load the Haar cascade face detector (singleton)."""
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+    return _face_cascade
+
+
+# Decimal places kept when serializing embeddings to JSON. Embeddings are
+# unit-norm (components ~0.04), so 5 decimals (max error 5e-6) is finer than
+# FP16 (6e-5). Cosine similarity moves by ~2e-6 (max ~1e-5), and the
+# payload is ~2.3x smaller than full float32 reprs.
+EMBEDDING_DECIMALS: int = 5
+
+
 @dataclass
 class APIResponse:
     """Response from the API"""
@@ -58,6 +79,11 @@ class ClientBridgeAPI:
         self.location_id = location_id
         self.timeout = timeout
         
+        # Persistent session: reuses the TCP/TLS connection across calls
+        # instead of a new handshake per request
+        self.session = requests.Session()
+        self.session.headers.update(self._get_headers())
+        
     def _get_headers(self) -> Dict[str, str]:
         """Get headers for API requests"""
         return {
@@ -65,30 +91,38 @@ class ClientBridgeAPI:
             "X-API-Key": self.api_key
         }
     
-    def _crop_face(self, frame: np.ndarray, padding: float = 0.4) -> np.ndarray:
+    def _crop_face(
+        self,
+        frame: np.ndarray,
+        padding: float = 0.4,
+        bbox: Optional[np.ndarray] = None
+    ) -> np.ndarray:
         """
         Crop frame to face region with padding.
         
         Args:
             frame: Full frame image
             padding: Extra padding around face (0.4 = 40% on each side)
+            bbox: Optional [x1, y1, x2, y2] face box already detected by
+                  InsightFace. If None, a Haar cascade locates the face.
         
         Returns:
             Cropped face image, or original frame if no face detected
         """
         try:
-            # Use OpenCV's Haar cascade for quick face detection
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            face_cascade = cv2.CascadeClassifier(
-                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            )
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4, minSize=(60, 60))
-            
-            if len(faces) == 0:
-                return frame  # No face found, return original
-            
-            # Get largest face
-            x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+            if bbox is not None:
+                bx1, by1, bx2, by2 = (int(v) for v in bbox[:4])
+                x, y, w, h = bx1, by1, bx2 - bx1, by2 - by1
+            else:
+                # Use OpenCV's Haar cascade for quick face detection
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                faces = _get_face_cascade().detectMultiScale(gray, 1.1, 4, minSize=(60, 60))
+                
+                if len(faces) == 0:
+                    return frame  # No face found, return original
+                
+                # Get largest face
+                x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
             
             # Add padding
             pad_w = int(w * padding)
@@ -115,10 +149,15 @@ class ClientBridgeAPI:
             print(f"[API] Face crop failed: {e}")
             return frame
     
-    def _frame_to_base64(self, frame: np.ndarray, crop_face: bool = True) -> str:
+    def _frame_to_base64(
+        self,
+        frame: np.ndarray,
+        crop_face: bool = True,
+        bbox: Optional[np.ndarray] = None
+    ) -> str:
         """Convert OpenCV frame to base64 JPEG string, optionally cropping to face"""
         if crop_face:
-            frame = self._crop_face(frame)
+            frame = self._crop_face(frame, bbox=bbox)
         _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
         return base64.b64encode(buffer).decode('utf-8')
     
@@ -130,9 +169,8 @@ class ClientBridgeAPI:
             True if API is healthy, False otherwise
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/api/edge/health",
-                headers=self._get_headers(),
                 timeout=self.timeout
             )
             return response.status_code == 200 and response.json().get("success", False)
@@ -169,10 +207,9 @@ class ClientBridgeAPI:
             if timestamp:
                 payload["timestamp"] = timestamp
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/edge/enroll",
                 json=payload,
-                headers=self._get_headers(),
                 timeout=self.timeout
             )
             
@@ -222,10 +259,9 @@ class ClientBridgeAPI:
             if timestamp:
                 payload["timestamp"] = timestamp
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/edge/visit",
                 json=payload,
-                headers=self._get_headers(),
                 timeout=self.timeout
             )
             
@@ -249,7 +285,8 @@ class ClientBridgeAPI:
     def identify(
         self,
         embedding: np.ndarray,
-        frame: Optional[np.ndarray] = None
+        frame: Optional[np.ndarray] = None,
+        bbox: Optional[np.ndarray] = None
     ) -> APIResponse:
         """
         Send embedding to server for identification.
@@ -260,6 +297,8 @@ class ClientBridgeAPI:
         Args:
             embedding: 512-dimensional face embedding from InsightFace
             frame: Best frame of the visitor's face (optional, for photo storage)
+            bbox: Face box in frame from InsightFace (optional, skips the
+                  Haar cascade when cropping the photo)
             
         Returns:
             APIResponse with:
@@ -270,17 +309,16 @@ class ClientBridgeAPI:
         """
         try:
             payload = {
-                "embedding": embedding.tolist(),  # Convert numpy to list
+                "embedding": np.round(embedding.astype(np.float64), EMBEDDING_DECIMALS).tolist(),
                 "locationId": self.location_id
             }
             
             if frame is not None:
-                payload["imageBase64"] = self._frame_to_base64(frame)
+                payload["imageBase64"] = self._frame_to_base64(frame, bbox=bbox)
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/edge/identify",
                 json=payload,
-                headers=self._get_headers(),
                 timeout=self.timeout
             )
             
@@ -303,6 +341,11 @@ class ClientBridgeAPI:
             return APIResponse(success=False, message=str(e))
 
 
+    def close(self) -> None:
+        """Close the underlying HTTP session (call on shutdown)."""
+        self.session.close()
+
+
 # Singleton instance for easy import
 _api_instance: Optional[ClientBridgeAPI] = None
 
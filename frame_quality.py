@@ -12,10 +12,34 @@ Metrics:
 """
 
 import cv2
+import time
 import numpy as np
 from typing import Tuple, Dict, Optional, List
 from dataclasses import dataclass
 
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional - scoring kernels run as plain Python without it
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Thresholds loaded once (face size values are passed to the JIT kernel as
+# arguments so cached compilations never bake in stale config values)
+try:
+    import config as cfg
+    FACE_SIZE_MIN_RATIO: float = cfg.FACE_SIZE_MIN_RATIO
+    FACE_SIZE_GOOD_RATIO: float = cfg.FACE_SIZE_GOOD_RATIO
+    FACE_SIZE_MIN_SCORE: float = cfg.FACE_SIZE_MIN_SCORE
+    MIN_FRAME_SHARPNESS: float = cfg.QUALITY_MIN_FRAME_SHARPNESS
+except (ImportError, AttributeError):
+    FACE_SIZE_MIN_RATIO = 0.02
+    FACE_SIZE_GOOD_RATIO = 0.08
+    FACE_SIZE_MIN_SCORE = 0.4
+    MIN_FRAME_SHARPNESS = 0.0
+
 
 @dataclass
 class QualityScore:
@@ -46,6 +70,8 @@ class QualityScore:
 
 # =============================================================================
 # FACE DETECTION (YuNet - modern, lightweight, accurate)
+# Standalone fallback only: visitor_counter.py passes InsightFace detections
+# into compute_quality_score() so no second detector runs per frame.
 # =============================================================================
 
 _yunet_detector = None
@@ -155,72 +181,132 @@ def detect_face_with_landmarks(frame: np.ndarray) -> Optional[Tuple[Tuple[int, i
 # QUALITY METRICS
 # =============================================================================
 
-def score_face_size(bbox: Tuple[int, int, int, int], frame_shape: Tuple[int, int]) -> float:
+@njit(cache=True, fastmath=True)
+def score_face_size(
+    face_width: float,
+    frame_width: float,
+    min_ratio: float = FACE_SIZE_MIN_RATIO,
+    good_ratio: float = FACE_SIZE_GOOD_RATIO,
+    min_score: float = FACE_SIZE_MIN_SCORE
+) -> float:
     """
     Score based on face size relative to frame.
     Larger faces are better for recognition.
     
+    Args:
+        face_width: Face bbox width in pixels
+        frame_width: Frame width in pixels
+        min_ratio, good_ratio, min_score: Thresholds (see config.py)
+    
     Returns:
         Score in [0, 1] range
     """
-    x1, y1, x2, y2 = bbox
-    face_width = x2 - x1
-    face_height = y2 - y1
-    frame_height, frame_width = frame_shape[:2]
-    
     # Use face width relative to frame width (more intuitive)
     width_ratio = face_width / frame_width
     
-    # Load thresholds from config
-    try:
-        import config as cfg
-        MIN_RATIO = cfg.FACE_SIZE_MIN_RATIO
-        GOOD_RATIO = cfg.FACE_SIZE_GOOD_RATIO
-        MIN_SCORE = cfg.FACE_SIZE_MIN_SCORE
-    except (ImportError, AttributeError):
-        MIN_RATIO = 0.02
-        GOOD_RATIO = 0.08
-        MIN_SCORE = 0.4
-    
-    if width_ratio < MIN_RATIO:
-        # Very small face - scale down from MIN_SCORE
-        return MIN_SCORE * (width_ratio / MIN_RATIO)
-    elif width_ratio < GOOD_RATIO:
-        # Decent face - linear scale from MIN_SCORE to 1.0
-        return MIN_SCORE + (1.0 - MIN_SCORE) * ((width_ratio - MIN_RATIO) / (GOOD_RATIO - MIN_RATIO))
+    if width_ratio < min_ratio:
+        # Very small face - scale down from min_score
+        return min_score * (width_ratio / min_ratio)
+    elif width_ratio < good_ratio:
+        # Decent face - linear scale from min_score to 1.0
+        return min_score + (1.0 - min_score) * ((width_ratio - min_ratio) / (good_ratio - min_ratio))
     else:
         return 1.0
 
 
-def score_sharpness(face_roi: np.ndarray) -> float:
+def _roi_stats(face_roi) -> Tuple[float, float, float]:
+    """
+    Compute the pixel statistics used by the sharpness, brightness and
+    contrast scores in one go (single grayscale conversion).
+    
+    Args:
+        face_roi: BGR or grayscale ndarray, or a grayscale cv2.UMat (the
+                  OpenCV calls then run through OpenCL)
+    
+    Returns:
+        (laplacian_variance, mean, std_dev) of the grayscale face ROI
+    """
+    is_bgr = isinstance(face_roi, np.ndarray) and face_roi.ndim == 3
+    gray = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY) if is_bgr else face_roi
+    
+    # CV_16S holds the uint8 Laplacian exactly and is 4x smaller than CV_64F
+    laplacian = cv2.Laplacian(gray, cv2.CV_16S)
+    mean, std = cv2.meanStdDev(gray)
+    lap_std = cv2.meanStdDev(laplacian)[1]
+    if isinstance(gray, cv2.UMat):
+        # Only these few scalars are downloaded from the device
+        mean, std, lap_std = mean.get(), std.get(), lap_std.get()
+    
+    return (float(lap_std[0, 0]) ** 2, float(mean[0, 0]), float(std[0, 0]))
+
+
+# ROIs smaller than this (either side) stay on the CPU: upload cost dominates
+OPENCL_MIN_ROI: int = 64
+
+_opencl_enabled = None
+
+
+def _use_opencl() -> bool:
+    """
+    Decide once whether ROI statistics should run through OpenCV's OpenCL
+    T-API (cv2.UMat). Only enabled if OpenCL is available and a quick
+    benchmark on a typical face ROI beats the CPU path; otherwise OpenCL
+    is switched off again process-wide.
+    """
+    global _opencl_enabled
+    
+    if _opencl_enabled is None:
+        _opencl_enabled = False
+        if cv2.ocl.haveOpenCL():
+            cv2.ocl.setUseOpenCL(True)
+            if cv2.ocl.useOpenCL():
+                sample = np.random.randint(0, 256, (160, 160, 3), dtype=np.uint8)
+                
+                def bench(wrap) -> float:
+                    _roi_stats(cv2.cvtColor(wrap(sample), cv2.COLOR_BGR2GRAY))  # Warm-up / kernel build
+                    t0 = time.perf_counter()
+                    for _ in range(10):
+                        _roi_stats(cv2.cvtColor(wrap(sample), cv2.COLOR_BGR2GRAY))
+                    return time.perf_counter() - t0
+                
+                _opencl_enabled = bench(cv2.UMat) < bench(lambda roi: roi)
+            if not _opencl_enabled:
+                # Do not leave OpenCL switched on for every other cv2 call
+                cv2.ocl.setUseOpenCL(False)
+    
+    return _opencl_enabled
+
+
+@njit(cache=True, fastmath=True)
+def score_sharpness(variance: float) -> float:
     """
     Score based on image sharpness using Laplacian variance.
     Higher variance = sharper image.
     
+    Args:
+        variance: Laplacian variance of the grayscale face ROI
+    
     Returns:
         Score in [0, 1] range
     """
-    gray = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY) if len(face_roi.shape) == 3 else face_roi
-    laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-    variance = laplacian.var()
-    
     # Normalize: <50 is blurry, >500 is very sharp
     # Typical good face: 100-300
     score = min(variance / 300.0, 1.0)
     return score
 
 
-def score_brightness(face_roi: np.ndarray) -> float:
+@njit(cache=True, fastmath=True)
+def score_brightness(mean_brightness: float) -> float:
     """
     Score based on brightness - penalize too dark or too bright.
     Optimal brightness is around 100-150 (out of 255).
     
+    Args:
+        mean_brightness: Mean of the grayscale face ROI
+    
     Returns:
         Score in [0, 1] range
     """
-    gray = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY) if len(face_roi.shape) == 3 else face_roi
-    mean_brightness = np.mean(gray)
-    
     # Optimal range: 80-180
     # Score drops off outside this range
     if mean_brightness < 40:
@@ -235,36 +321,45 @@ def score_brightness(face_roi: np.ndarray) -> float:
         return 0.5 - 0.5 * (mean_brightness - 220) / 35.0
 
 
-def score_contrast(face_roi: np.ndarray) -> float:
+@njit(cache=True, fastmath=True)
+def score_contrast(std_dev: float) -> float:
     """
     Score based on contrast using standard deviation.
     Good contrast helps with feature extraction.
     
+    Args:
+        std_dev: Standard deviation of the grayscale face ROI
+    
     Returns:
         Score in [0, 1] range
     """
-    gray = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY) if len(face_roi.shape) == 3 else face_roi
-    std_dev = np.std(gray)
-    
     # Normalize: <20 is low contrast, >60 is good
     score = min(std_dev / 60.0, 1.0)
     return score
 
 
-def estimate_head_pose_from_landmarks(landmarks: dict, bbox: Tuple[int, int, int, int]) -> Tuple[float, float]:
+def estimate_head_pose_from_landmarks(
+    landmarks: dict,
+    bbox: Tuple[int, int, int, int],
+    face_w: Optional[int] = None,
+    face_h: Optional[int] = None
+) -> Tuple[float, float]:
     """
     Estimate head pose from pre-computed YuNet landmarks.
     
     Args:
         landmarks: Dict with right_eye, left_eye, nose positions
         bbox: (x1, y1, x2, y2) face bounding box
+        face_w, face_h: Optional bbox size if the caller already has it
     
     Returns:
         (yaw, pitch) in degrees
     """
     x1, y1, x2, y2 = bbox
-    face_w = x2 - x1
-    face_h = y2 - y1
+    if face_w is None:
+        face_w = x2 - x1
+    if face_h is None:
+        face_h = y2 - y1
     
     right_eye = landmarks['right_eye']
     left_eye = landmarks['left_eye']
@@ -292,13 +387,44 @@ def estimate_head_pose_from_landmarks(landmarks: dict, bbox: Tuple[int, int, int
     return (yaw, pitch + roll_penalty * 0.3)
 
 
-def estimate_head_pose(frame: np.ndarray, face_bbox: Tuple[int, int, int, int]) -> Optional[Tuple[float, float]]:
+def landmarks_from_kps(kps: np.ndarray, det_score: float = 0.0) -> dict:
+    """
+    Convert InsightFace 5-point landmarks to the YuNet landmarks dict.
+    
+    Both detectors order points as right eye, left eye, nose, right mouth,
+    left mouth (subject's side), so pose estimation is shared.
+    
+    Args:
+        kps: (5, 2) array from an InsightFace Face
+        det_score: Detection confidence
+    """
+    return {
+        'right_eye': (float(kps[0][0]), float(kps[0][1])),
+        'left_eye': (float(kps[1][0]), float(kps[1][1])),
+        'nose': (float(kps[2][0]), float(kps[2][1])),
+        'right_mouth': (float(kps[3][0]), float(kps[3][1])),
+        'left_mouth': (float(kps[4][0]), float(kps[4][1])),
+        'score': float(det_score)
+    }
+
+
+def estimate_head_pose(
+    frame: np.ndarray,
+    face_bbox: Tuple[int, int, int, int],
+    gray_face: Optional[np.ndarray] = None
+) -> Optional[Tuple[float, float]]:
     """
     Estimate head pose (yaw, pitch) using YuNet landmarks.
     
     Note: This runs detection again. For batch processing, use 
     estimate_head_pose_from_landmarks() with pre-computed landmarks.
     
+    Args:
+        frame: BGR image
+        face_bbox: (x1, y1, x2, y2) face bounding box
+        gray_face: Optional grayscale crop of face_bbox the caller already
+                   converted; reused by the symmetry fallback
+    
     Returns:
         (yaw, pitch) in degrees, or None if landmarks not detected
     """
@@ -306,12 +432,15 @@ def estimate_head_pose(frame: np.ndarray, face_bbox: Tuple[int, int, int, int])
     
     if result is None:
         # Fallback to symmetry-based estimation
-        x1, y1, x2, y2 = face_bbox
-        face_roi = frame[y1:y2, x1:x2]
-        if face_roi.size == 0:
+        if gray_face is None:
+            x1, y1, x2, y2 = face_bbox
+            face_roi = frame[y1:y2, x1:x2]
+            if face_roi.size == 0:
+                return (0.0, 0.0)
+            gray_face = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY)
+        if gray_face.size == 0:
             return (0.0, 0.0)
-        gray_roi = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY)
-        return estimate_pose_from_symmetry(gray_roi)
+        return estimate_pose_from_symmetry(gray_face)
     
     bbox, landmarks = result
     return estimate_head_pose_from_landmarks(landmarks, bbox)
@@ -322,24 +451,35 @@ def estimate_pose_from_symmetry(gray_face: np.ndarray) -> Tuple[float, float]:
     Fallback pose estimation using face symmetry.
     A frontal face should be roughly symmetric left-to-right.
     
+    The bbox is rarely centred exactly on the nose, so the mirror axis is
+    searched over a few positions around the centre and the most symmetric
+    one is used.
+    
     Returns:
         (yaw, pitch) estimates in degrees
     """
     h, w = gray_face.shape
     
-    # Split face into left and right halves
-    left_half = gray_face[:, :w//2]
-    right_half = gray_face[:, w//2:]
-    right_half_flipped = cv2.flip(right_half, 1)
-    
-    # Resize to same size if needed
-    min_w = min(left_half.shape[1], right_half_flipped.shape[1])
-    left_half = left_half[:, :min_w]
-    right_half_flipped = right_half_flipped[:, :min_w]
+    # Mirrored column j is original column (w-1-j), so comparing column x
+    # with mirrored column x+t mirrors the face about x = (w-1-t)/2
+    mirrored = cv2.flip(gray_face, 1)
+    step = max(1, w // 20)
+    
+    asymmetry = None
+    for t in (-2 * step, -step, 0, step, 2 * step):
+        if abs(t) >= w // 2:
+            continue
+        if t >= 0:
+            diff = cv2.absdiff(gray_face[:, :w - t], mirrored[:, t:])
+        else:
+            diff = cv2.absdiff(gray_face[:, -t:], mirrored[:, :w + t])
+        
+        candidate = cv2.mean(diff)[0] / 255.0  # Normalize to 0-1
+        if asymmetry is None or candidate < asymmetry:
+            asymmetry = candidate
     
-    # Compute difference (asymmetry)
-    diff = cv2.absdiff(left_half, right_half_flipped)
-    asymmetry = np.mean(diff) / 255.0  # Normalize to 0-1
+    if asymmetry is None:
+        return (0.0, 0.0)
     
     # Higher asymmetry suggests turned face
     # Map to approximate yaw (very rough estimate)
@@ -351,6 +491,7 @@ def estimate_pose_from_symmetry(gray_face: np.ndarray) -> Tuple[float, float]:
     return (yaw, pitch)
 
 
+@njit(cache=True, fastmath=True)
 def score_frontality(yaw: float, pitch: float) -> float:
     """
     Score based on how frontal the face is.
@@ -409,11 +550,35 @@ def apply_penalty(score: float, factor_value: float, importance: float) -> float
     return score * multiplier
 
 
+def passes_blur_gate(frame: np.ndarray) -> bool:
+    """
+    Cheap whole-frame blur gate run before full scoring.
+    
+    Laplacian variance on a 128x128 downscale costs a fraction of the full
+    scoring path and rejects frames that are blurred overall (motion,
+    refocus) early. compute_quality_score() returns None for rejected
+    frames; callers can use this to tell that apart from "no face".
+    
+    Returns:
+        True if the frame is sharp enough to be worth scoring (always True
+        when MIN_FRAME_SHARPNESS is 0)
+    """
+    if MIN_FRAME_SHARPNESS <= 0:
+        return True
+    small = cv2.resize(frame, (128, 128), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    # meanStdDev works on the int16 buffer directly (ndarray.var() would
+    # first expand it to a float64 copy)
+    lap_std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))[1][0, 0]
+    return lap_std * lap_std > MIN_FRAME_SHARPNESS
+
+
 def compute_quality_score(
     frame: np.ndarray,
     bbox: Optional[Tuple[int, int, int, int]] = None,
     importance: Dict[str, float] = None,
-    base_score: float = None
+    base_score: float = None,
+    face=None
 ) -> Optional[QualityScore]:
     """
     Compute overall quality score for a frame using multiplicative penalties.
@@ -426,10 +591,15 @@ def compute_quality_score(
         bbox: Optional face bounding box. If None, will detect face.
         importance: Importance values for each metric (0-10 scale)
         base_score: Starting score before penalties (default 1000)
+        face: Optional InsightFace Face (bbox, kps, det_score) already
+              detected for this frame. Skips detection entirely.
     
     Returns:
-        QualityScore object or None if no face found
+        QualityScore object or None if no face found or frame too blurry
     """
+    if not passes_blur_gate(frame):
+        return None
+    
     # Import config for defaults
     try:
         import config as cfg
@@ -449,24 +619,33 @@ def compute_quality_score(
         if base_score is None:
             base_score = 1000.0
     
-    # Detect face with landmarks (single detection for both bbox and pose)
+    frame_h, frame_w = frame.shape[:2]
+    
+    # Reuse an upstream detection if given, else detect face with landmarks
+    # (single detection for both bbox and pose)
     landmarks = None
-    if bbox is None:
+    if face is not None:
+        fx1, fy1, fx2, fy2 = face.bbox
+        bbox = (max(0, int(fx1)), max(0, int(fy1)), min(frame_w, int(fx2)), min(frame_h, int(fy2)))
+        if face.kps is not None:
+            landmarks = landmarks_from_kps(face.kps, face.det_score)
+    elif bbox is None:
         result = detect_face_with_landmarks(frame)
         if result is None:
             return None
         bbox, landmarks = result
     
     x1, y1, x2, y2 = bbox
+    face_w = x2 - x1
+    face_h = y2 - y1
     
     # Add padding to face ROI (10% on each side)
-    h, w = frame.shape[:2]
-    pad_x = int((x2 - x1) * 0.1)
-    pad_y = int((y2 - y1) * 0.1)
+    pad_x = int(face_w * 0.1)
+    pad_y = int(face_h * 0.1)
     x1_pad = max(0, x1 - pad_x)
     y1_pad = max(0, y1 - pad_y)
-    x2_pad = min(w, x2 + pad_x)
-    y2_pad = min(h, y2 + pad_y)
+    x2_pad = min(frame_w, x2 + pad_x)
+    y2_pad = min(frame_h, y2 + pad_y)
     
     face_roi = frame[y1_pad:y2_pad, x1_pad:x2_pad]
     
@@ -474,20 +653,37 @@ def compute_quality_score(
         return None
     
     # Compute individual factor scores (all 0-1 range)
-    size_score = score_face_size(bbox, frame.shape[:2])
-    sharp_score = score_sharpness(face_roi)
-    bright_score = score_brightness(face_roi)
-    contrast_score = score_contrast(face_roi)
+    size_score = score_face_size(
+        float(face_w), float(frame_w),
+        FACE_SIZE_MIN_RATIO, FACE_SIZE_GOOD_RATIO, FACE_SIZE_MIN_SCORE
+    )
+    # Convert once; the pose fallback reuses the unpadded part of this crop
+    roi_h, roi_w = face_roi.shape[:2]
+    if min(roi_h, roi_w) >= OPENCL_MIN_ROI and _use_opencl():
+        gray_roi = cv2.cvtColor(cv2.UMat(face_roi), cv2.COLOR_BGR2GRAY)
+    else:
+        gray_roi = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY)
+    lap_var, mean_brightness, std_dev = _roi_stats(gray_roi)
+    sharp_score = score_sharpness(lap_var)
+    bright_score = score_brightness(mean_brightness)
+    contrast_score = score_contrast(std_dev)
     
     # Compute head pose for frontality (use cached landmarks if available)
     if landmarks is not None:
-        yaw, pitch = estimate_head_pose_from_landmarks(landmarks, bbox)
-        frontal_score = score_frontality(yaw, pitch)
+        yaw, pitch = estimate_head_pose_from_landmarks(landmarks, bbox, face_w, face_h)
+        frontal_score = score_frontality(float(yaw), float(pitch))
     else:
-        pose = estimate_head_pose(frame, bbox)
+        if isinstance(gray_roi, cv2.UMat):
+            gray_roi = gray_roi.get()
+        gray_face = gray_roi[y1 - y1_pad:y2 - y1_pad, x1 - x1_pad:x2 - x1_pad]
+        if face is not None:
+            # Upstream detection without landmarks: never run a second detector
+            pose = estimate_pose_from_symmetry(gray_face) if gray_face.size else (0.0, 0.0)
+        else:
+            pose = estimate_head_pose(frame, bbox, gray_face=gray_face)
         if pose is not None:
             yaw, pitch = pose
-            frontal_score = score_frontality(yaw, pitch)
+            frontal_score = score_frontality(float(yaw), float(pitch))
         else:
             yaw, pitch = 0.0, 0.0
             frontal_score = 0.5
@@ -513,12 +709,15 @@ def compute_quality_score(
     )
 
 
-def score_frames(frames: List[np.ndarray]) -> List[Tuple[int, np.ndarray, QualityScore]]:
+def score_frames(frames: List[np.ndarray], faces: Optional[List] = None) -> List[Tuple[int, np.ndarray, QualityScore]]:
     """
     Score multiple frames and return sorted by quality.
     
     Args:
         frames: List of BGR images
+        faces: Optional list of pre-detected InsightFace Face objects, one per
+               frame (None = no face in that frame). If omitted, faces are
+               detected with YuNet.
     
     Returns:
         List of (frame_index, frame, score) tuples, sorted by total score descending
@@ -526,7 +725,12 @@ def score_frames(frames: List[np.ndarray]) -> List[Tuple[int, np.ndarray, Qualit
     results = []
     
     for i, frame in enumerate(frames):
-        score = compute_quality_score(frame)
+        if faces is not None:
+            if faces[i] is None:
+                continue
+            score = compute_quality_score(frame, face=faces[i])
+        else:
+            score = compute_quality_score(frame)
         if score is not None:
             results.append((i, frame, score))
     
@@ -547,3 +751,12 @@ def get_best_frame(frames: List[np.ndarray]) -> Optional[Tuple[np.ndarray, Quali
     if not scored:
         return None
     return (scored[0][1], scored[0][2])
+
+
+# Compile the JIT kernels at import (or load them from the on-disk cache)
+# so the first captured frame does not pay the compilation cost
+score_face_size(100.0, 1280.0, FACE_SIZE_MIN_RATIO, FACE_SIZE_GOOD_RATIO, FACE_SIZE_MIN_SCORE)
+score_sharpness(100.0)
+score_brightness(100.0)
+score_contrast(40.0)
+score_frontality(0.0, 0.0)
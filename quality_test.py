@@ -19,7 +19,7 @@ from datetime import datetime
 from typing import List, Tuple
 import numpy as np
 
-from frame_quality import compute_quality_score, QualityScore
+from frame_quality import compute_quality_score, passes_blur_gate, QualityScore
 
 
 # =============================================================================
@@ -262,17 +262,28 @@ def run_test():
                 # Score all frames
                 print("Scoring frames...")
                 scored_frames = []
+                blurry = 0
                 
                 for i, f in enumerate(frames):
+                    if not passes_blur_gate(f):
+                        blurry += 1
+                        continue
                     score = compute_quality_score(f)
                     if score is not None:
                         scored_frames.append((i, f, score))
                 
                 print(f"Faces detected in {len(scored_frames)}/{len(frames)} frames")
+                if blurry:
+                    print(f"Rejected {blurry}/{len(frames)} frames: frame too blurry "
+                          f"(QUALITY_MIN_FRAME_SHARPNESS)")
                 
                 if not scored_frames:
-                    print("WARNING: No faces detected in any frame!")
-                    print("Make sure your face is visible to the camera.")
+                    if blurry == len(frames):
+                        print("WARNING: All frames rejected as too blurry!")
+                        print("Hold still, or lower QUALITY_MIN_FRAME_SHARPNESS in config.py.")
+                    else:
+                        print("WARNING: No faces detected in any frame!")
+                        print("Make sure your face is visible to the camera.")
                     continue
                 
                 # Sort by score
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+INT8 Model Quantization Script
+Builds an INT8 copy of the InsightFace model pack for CPU inference.
+
+The detection and recognition ONNX graphs are statically quantized (QDQ,
+uint8 activations / int8 per-channel weights) with ONNX Runtime, calibrated
+on real frames. On CPUs with VNNI (AVX-512 VNNI / AVX-VNNI) the int8 kernels
+of ONNX Runtime or the OpenVINO execution provider run these graphs ~2-3x
+faster than FP32. The remaining models of the pack are copied unchanged, so
+FaceAnalysis loads the new pack like any other and extract_embeddings() is
+unaffected.
+
+Usage:
+    python quantize_models.py <calibration_image_dir> [max_images]
+
+    Then set in config.py:
+        INSIGHTFACE_MODEL = "<model>_int8"   (e.g. "buffalo_s_int8")
+
+Calibration images should look like production frames (same camera, store
+lighting, people at typical distances). A few hundred are enough.
+"""
+
+import cv2
+import os
+import sys
+import shutil
+from typing import Dict, List, Optional
+import numpy as np
+
+from onnxruntime.quantization import (
+    CalibrationDataReader, QuantFormat, QuantType, quantize_static
+)
+from insightface.utils import face_align
+
+from face_recognition import get_face_analyzer, MODEL_NAME, MODEL_DIR
+
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DEFAULT_MAX_IMAGES: int = 300
+OUTPUT_SUFFIX: str = "_int8"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+# =============================================================================
+# CALIBRATION DATA
+# =============================================================================
+
+def load_images(image_dir: str, max_images: int) -> List[np.ndarray]:
+    """Load up to max_images BGR images from a directory."""
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        img = cv2.imread(os.path.join(image_dir, name))
+        if img is not None:
+            images.append(img)
+        if len(images) >= max_images:
+            break
+    return images
+
+
+def detection_blob(img: np.ndarray, det_model) -> np.ndarray:
+    """Preprocess a frame exactly like InsightFace's SCRFD.detect()."""
+    input_size = det_model.input_size
+    im_ratio = float(img.shape[0]) / img.shape[1]
+    model_ratio = float(input_size[1]) / input_size[0]
+    if im_ratio > model_ratio:
+        new_h = input_size[1]
+        new_w = int(new_h / im_ratio)
+    else:
+        new_w = input_size[0]
+        new_h = int(new_w * im_ratio)
+
+    det_img = np.zeros((input_size[1], input_size[0], 3), dtype=np.uint8)
+    det_img[:new_h, :new_w] = cv2.resize(img, (new_w, new_h))
+
+    mean = det_model.input_mean
+    return cv2.dnn.blobFromImage(det_img, 1.0 / det_model.input_std, input_size,
+                                 (mean, mean, mean), swapRB=True)
+
+
+def recognition_blob(img: np.ndarray, kps: np.ndarray, rec_model) -> np.ndarray:
+    """Preprocess a face exactly like InsightFace's ArcFaceONNX.get()."""
+    input_size = rec_model.input_size
+    crop = face_align.norm_crop(img, landmark=kps, image_size=input_size[0])
+    mean = rec_model.input_mean
+    return cv2.dnn.blobFromImage(crop, 1.0 / rec_model.input_std, input_size,
+                                 (mean, mean, mean), swapRB=True)
+
+
+class BlobReader(CalibrationDataReader):
+    """Feeds precomputed input blobs to the ONNX Runtime calibrator."""
+
+    def __init__(self, input_name: str, blobs: List[np.ndarray]):
+        self.input_name = input_name
+        self._iter = iter(blobs)
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        blob = next(self._iter, None)
+        return None if blob is None else {self.input_name: blob}
+
+
+# =============================================================================
+# QUANTIZATION
+# =============================================================================
+
+def quantize_model(model_file: str, output_file: str, reader: BlobReader):
+    """Statically quantize one ONNX model to INT8 (QDQ format)."""
+    quantize_static(
+        model_file,
+        output_file,
+        reader,
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+
+
+def run(image_dir: str, max_images: int = DEFAULT_MAX_IMAGES):
+    """Build <MODEL_NAME>_int8 next to the FP32 pack in MODEL_DIR."""
+    images = load_images(image_dir, max_images)
+    if not images:
+        print(f"No images found in {image_dir}")
+        return
+    print(f"Loaded {len(images)} calibration images")
+
+    # The FP32 pack provides the landmarks for the recognition crops
+    app = get_face_analyzer()
+    det_model = app.det_model
+    rec_model = app.models['recognition']
+
+    det_blobs = []
+    rec_blobs = []
+    for img in images:
+        det_blobs.append(detection_blob(img, det_model))
+        for face in app.get(img):
+            rec_blobs.append(recognition_blob(img, face.kps, rec_model))
+
+    if not rec_blobs:
+        print("No faces found in calibration images - recognition model needs face samples")
+        return
+    print(f"Calibration set: {len(det_blobs)} frames, {len(rec_blobs)} faces")
+
+    src_dir = os.path.dirname(det_model.model_file)
+    out_dir = os.path.join(MODEL_DIR, "models", MODEL_NAME + OUTPUT_SUFFIX)
+    os.makedirs(out_dir, exist_ok=True)
+
+    quantized = {
+        det_model.model_file: BlobReader(det_model.input_name, det_blobs),
+        rec_model.model_file: BlobReader(rec_model.input_name, rec_blobs),
+    }
+
+    for name in sorted(os.listdir(src_dir)):
+        if not name.endswith('.onnx'):
+            continue
+        src = os.path.join(src_dir, name)
+        dst = os.path.join(out_dir, name)
+        if src in quantized:
+            print(f"Quantizing {name}...")
+            quantize_model(src, dst, quantized[src])
+        else:
+            shutil.copyfile(src, dst)
+
+    print(f"\nINT8 model pack written to: {out_dir}")
+    print(f'Set INSIGHTFACE_MODEL = "{MODEL_NAME + OUTPUT_SUFFIX}" in config.py to use it')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python quantize_models.py <calibration_image_dir> [max_images]")
+        sys.exit(1)
+
+    run(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MAX_IMAGES)
@@ -26,10 +26,10 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import database as db
 from face_recognition import (
+    EmbeddingIndex,
     extract_embeddings,
-    find_best_match,
     get_face_analyzer,
-    cosine_similarity,
+    cosine_similarities,
     SIMILARITY_THRESHOLD
 )
 
@@ -51,11 +51,16 @@ def resize_frame(frame, target_width):
     new_h = int(h * scale)
     return cv2.resize(frame, (target_width, new_h))
 
-def save_debug_image(frame, face_results, capture_num):
-    """Save debug image with face boxes drawn."""
+def save_debug_image(frame, face_results, capture_num, inplace=False):
+    """
+    Save debug image with face boxes drawn.
+    
+    With inplace=True the boxes are drawn straight onto frame (no full-frame
+    copy); only use it when the caller no longer needs the clean frame.
+    """
     os.makedirs(DEBUG_DIR, exist_ok=True)
     
-    debug_frame = frame.copy()
+    debug_frame = frame if inplace else frame.copy()
     
     # Draw face boxes if any
     if face_results:
@@ -71,7 +76,9 @@ def save_debug_image(frame, face_results, capture_num):
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"{DEBUG_DIR}/capture_{capture_num:03d}_{timestamp}.jpg"
-    cv2.imwrite(filename, debug_frame)
+    _, buffer = cv2.imencode('.jpg', debug_frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    with open(filename, 'wb') as f:
+        f.write(buffer.tobytes())
     print(f"  Debug image saved: {filename}")
     return filename
 
@@ -134,6 +141,9 @@ def run_test():
     print("READY - Ask person to stand in front of camera, then press ENTER")
     print("=" * 60 + "\n")
     
+    # Known visitors, kept in sync with the database on enroll/reset
+    index = EmbeddingIndex(db.get_all_embeddings())
+    
     capture_count = 0
     
     while True:
@@ -144,6 +154,7 @@ def run_test():
             break
         elif user_input == 'r':
             reset_database()
+            index = EmbeddingIndex()
             continue
         
         # Capture fresh frame (reconnects to camera)
@@ -160,8 +171,8 @@ def run_test():
         print(f"  Frame shape: {frame.shape}")
         face_results = extract_embeddings(frame)
         
-        # Always save debug image
-        save_debug_image(frame, face_results, capture_count)
+        # Always save debug image (frame is not needed afterwards)
+        save_debug_image(frame, face_results, capture_count, inplace=True)
         
         if not face_results:
             print("⚠ No face detected - ask person to face the camera")
@@ -170,26 +181,22 @@ def run_test():
         
         print(f"Detected {len(face_results)} face(s)")
         
-        # Load known embeddings
-        known_embeddings = db.get_all_embeddings()
-        
         for i, (embedding, bbox, det_score) in enumerate(face_results):
             print(f"\nFace {i+1}:")
             print(f"  Detection confidence: {det_score:.2f}")
             print(f"  Bounding box: {bbox.astype(int).tolist()}")
             
             # Show similarity to all known visitors
-            if known_embeddings:
-                print(f"\n  Comparing against {len(known_embeddings)} known visitor(s):")
-                similarities = []
-                for visitor_id, known_emb in known_embeddings:
-                    sim = cosine_similarity(embedding, known_emb)
-                    similarities.append((visitor_id, sim))
+            if len(index):
+                print(f"\n  Comparing against {len(index)} known visitor(s):")
+                sims = cosine_similarities(embedding, index.matrix)
+                similarities = list(zip(index.ids.tolist(), sims.tolist()))
+                for visitor_id, sim in similarities:
                     status = "✓ MATCH" if sim >= SIMILARITY_THRESHOLD else ""
                     print(f"    Visitor #{visitor_id}: similarity = {sim:.3f} {status}")
                 
                 # Find best match
-                match = find_best_match(embedding, known_embeddings)
+                match = index.find_best_match(embedding)
                 
                 if match:
                     visitor_id, similarity = match
@@ -204,14 +211,16 @@ def run_test():
                     print(f"     Creating new visitor...")
                     
                     visitor_id = db.add_visitor(embedding)
+                    index.add(visitor_id, embedding)
                     print(f"  ✅ NEW VISITOR #{visitor_id} enrolled")
             else:
                 print("\n  No visitors in database yet")
                 visitor_id = db.add_visitor(embedding)
+                index.add(visitor_id, embedding)
                 print(f"  ✅ FIRST VISITOR #{visitor_id} enrolled")
         
-        # Show database state
-        print(f"\n  Database: {db.get_visitor_count()} unique visitor(s)")
+        # Show database state (the index mirrors the visitors table)
+        print(f"\n  Database: {len(index)} unique visitor(s)")
         print()
     
     print("\nTest ended.")
@@ -22,6 +22,9 @@ import sys
 import argparse
 import logging
 import base64
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, List, Tuple
 from dataclasses import dataclass
@@ -29,14 +32,18 @@ import numpy as np
 
 import config as cfg
 from face_recognition import (
+    DET_SIZE,
+    Face,
+    detect_largest_face,
     extract_embeddings,
     get_face_analyzer,
+    scale_face,
 )
 from frame_quality import (
     compute_quality_score,
+    passes_blur_gate,
     score_frames,
     get_best_frame,
-    detect_face,
     QualityScore
 )
 from api_client import ClientBridgeAPI, init_api, get_api
@@ -63,6 +70,7 @@ class PersonCapture:
     frames: List[np.ndarray]
     start_time: float
     trigger_frame: np.ndarray  # The frame that triggered detection
+    trigger_face: Optional[Face] = None  # InsightFace detection on trigger_frame
 
 
 # =============================================================================
@@ -70,11 +78,75 @@ class PersonCapture:
 # =============================================================================
 
 def resize_frame(frame: np.ndarray, target_width: int) -> np.ndarray:
-    """Resize frame maintaining aspect ratio."""
+    """
+    Downscale frame to target_width maintaining aspect ratio.
+    Frames already at or below target_width are returned unchanged.
+    """
     h, w = frame.shape[:2]
+    if w <= target_width:
+        return frame
     scale = target_width / w
     new_h = int(h * scale)
-    return cv2.resize(frame, (target_width, new_h))
+    return cv2.resize(frame, (target_width, new_h), interpolation=cv2.INTER_AREA)
+
+
+def hw_decode_pipeline(source: str, codec: str = "h264") -> Optional[str]:
+    """
+    GStreamer pipeline decoding an RTSP stream on this platform's hardware
+    decoder, or None if there is no known one (e.g. macOS).
+    
+    Args:
+        source: rtsp:// URL
+        codec: "h264" or "h265"
+    """
+    if cfg.IS_JETSON:
+        decode = "nvv4l2decoder ! nvvidconv ! video/x-raw,format=BGRx"
+    elif sys.platform.startswith("linux"):
+        decode = f"vaapi{codec}dec ! vaapipostproc ! video/x-raw,format=BGRx"
+    elif sys.platform == "win32":
+        # d3d11download only copies to system memory (NV12); videoconvert converts
+        decode = f"d3d11{codec}dec ! d3d11download"
+    else:
+        return None
+    
+    return (
+        f"rtspsrc location={source} latency=100 protocols=tcp ! "
+        f"rtp{codec}depay ! {codec}parse ! {decode} ! "
+        "videoconvert ! video/x-raw,format=BGR ! "
+        "appsink drop=1 max-buffers=2"
+    )
+
+
+def open_camera(source) -> cv2.VideoCapture:
+    """
+    Open the camera stream.
+    
+    RTSP is decoded on the hardware video decoder through a GStreamer
+    pipeline (see hw_decode_pipeline) so the CPU is left for detection and
+    scoring. If that pipeline cannot be opened, RTSP goes through OpenCV's
+    FFmpeg backend.
+    """
+    is_rtsp = isinstance(source, str) and source.startswith("rtsp://")
+    
+    pipeline = hw_decode_pipeline(source, cfg.RTSP_CODEC) if is_rtsp and cfg.USE_HW_DECODE else None
+    if pipeline is not None:
+        cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+        if cap.isOpened():
+            return cap
+        logger.warning("GStreamer hardware decode unavailable, falling back to FFmpeg")
+    
+    if is_rtsp:
+        # RTSP over TCP (more reliable than UDP), without FFmpeg's input
+        # jitter buffer so decoded frames are as fresh as possible
+        os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp|fflags;nobuffer"
+        cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+    else:
+        cap = cv2.VideoCapture(source)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    if isinstance(source, int):
+        # Webcams can deliver the processing width directly (RTSP ignores this)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, cfg.TARGET_WIDTH)
+    return cap
 
 
 def save_visitor_image(frame: np.ndarray, visitor_id: int, session_id: str) -> str:
@@ -86,54 +158,123 @@ def save_visitor_image(frame: np.ndarray, visitor_id: int, session_id: str) -> s
     return filename
 
 
+# =============================================================================
+# FRAME READER
+# =============================================================================
+
+class FrameReader:
+    """
+    Reads frames on a background thread and keeps only the newest one.
+    
+    The main loop never blocks on network I/O and never works through a
+    backlog of stale frames while detection or the API call is running.
+    Frames are numbered so callers can still sample every Nth stream frame.
+    The reader owns the capture and releases it when its thread exits.
+    """
+    
+    def __init__(self, cap: cv2.VideoCapture):
+        self.cap = cap
+        self._cond = threading.Condition()
+        self._frame: Optional[np.ndarray] = None
+        self._seq = 0
+        self._ok = True
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _run(self) -> None:
+        try:
+            while self._running:
+                ret, frame = self.cap.read()
+                with self._cond:
+                    if not ret:
+                        self._ok = False
+                        self._cond.notify_all()
+                        return
+                    self._frame = frame
+                    self._seq += 1
+                    self._cond.notify_all()
+        finally:
+            # Released here, never while cap.read() may still be running on
+            # this thread (an RTSP read can block for ~30s)
+            self.cap.release()
+    
+    @property
+    def seq(self) -> int:
+        """Sequence number of the newest frame read so far."""
+        with self._cond:
+            return self._seq
+    
+    def read(self, after_seq: int, timeout: float = 5.0) -> Tuple[bool, Optional[np.ndarray], int]:
+        """
+        Wait for a frame newer than after_seq.
+        
+        Returns:
+            (ok, frame, seq) - ok is False if the stream ended or timed out
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or not self._ok, timeout)
+            if self._seq <= after_seq:
+                return (False, None, after_seq)
+            return (True, self._frame, self._seq)
+    
+    def stop(self) -> None:
+        """Stop the reader thread; it releases the capture once its current read returns."""
+        self._running = False
+        self._thread.join(timeout=1.0)
+
+
 # =============================================================================
 # FRAME CAPTURE
 # =============================================================================
 
 def capture_frames_for_person(
-    cap: cv2.VideoCapture,
+    reader: FrameReader,
     trigger_frame: np.ndarray,
     duration: float,
     frame_skip: int,
-    target_width: int
+    target_width: int,
+    trigger_face: Optional[Face] = None
 ) -> PersonCapture:
     """
     Capture frames for a detected person over specified duration.
     
     Args:
-        cap: Video capture object
+        reader: Background frame reader
         trigger_frame: The frame that triggered detection
         duration: How long to capture (seconds)
         frame_skip: Keep every Nth frame
         target_width: Resize frames to this width
+        trigger_face: Face already detected on trigger_frame
     
     Returns:
         PersonCapture with collected frames
     """
     session_id = datetime.now().strftime('%Y%m%d_%H%M%S')
     frames = [trigger_frame]  # Include the trigger frame
-    frame_count = 0
+    start_seq = last_seq = reader.seq
     start_time = time.time()
     
-    logger.debug(f"Capturing frames for {duration}s (every {frame_skip} frame)...")
+    logger.debug("Capturing frames for %ss (every %d frame)...", duration, frame_skip)
     
     while time.time() - start_time < duration:
-        ret, frame = cap.read()
+        # Wait for the frame_skip-th frame after the last one kept
+        ret, frame, last_seq = reader.read(last_seq + frame_skip - 1)
         if not ret:
             break
         
-        frame_count += 1
-        if frame_count % frame_skip == 0:
-            frame_resized = resize_frame(frame, target_width)
-            frames.append(frame_resized)
+        frame_resized = resize_frame(frame, target_width)
+        frames.append(frame_resized)
     
-    logger.debug(f"Captured {len(frames)} frames ({frame_count} total, kept every {frame_skip})")
+    frame_count = last_seq - start_seq
+    logger.debug("Captured %d frames (%d total, kept every %d)", len(frames), frame_count, frame_skip)
     
     return PersonCapture(
         session_id=session_id,
         frames=frames,
         start_time=start_time,
-        trigger_frame=trigger_frame
+        trigger_frame=trigger_frame,
+        trigger_face=trigger_face
     )
 
 
@@ -145,15 +286,26 @@ def select_best_frame(capture: PersonCapture) -> Tuple[np.ndarray, QualityScore,
     """
     Score all frames and select the best one.
     
+    Faces are detected once per frame with the InsightFace detector and passed
+    into the scorer (the trigger frame reuses its detection).
+    
     Returns:
         (best_frame, best_score, all_scored_frames)
     """
-    scored = score_frames(capture.frames)
+    faces = [capture.trigger_face] + [detect_largest_face(f) for f in capture.frames[1:]]
+    scored = score_frames(capture.frames, faces=faces)
     
     if not scored:
-        # Fallback to trigger frame if no faces detected in any frame
-        logger.warning("No faces detected in captured frames, using trigger frame")
-        score = compute_quality_score(capture.trigger_frame)
+        # Fallback to trigger frame if no frame could be scored
+        face_frames = [f for f, face in zip(capture.frames, faces) if face is not None]
+        if face_frames and not any(passes_blur_gate(f) for f in face_frames):
+            logger.warning("All %d frames with a face rejected: frame too blurry "
+                           "(QUALITY_MIN_FRAME_SHARPNESS), using trigger frame", len(face_frames))
+        else:
+            logger.warning("No faces detected in captured frames, using trigger frame")
+        score = None
+        if capture.trigger_face is not None:
+            score = compute_quality_score(capture.trigger_frame, face=capture.trigger_face)
         if score is None:
             # Create a minimal score for the trigger frame
             score = QualityScore(
@@ -195,6 +347,13 @@ def draw_face_box(image: np.ndarray, bbox: Tuple[int, int, int, int], score: flo
     return img
 
 
+def _log_io_error(future: Future) -> None:
+    """Done-callback for background debug I/O: log instead of losing errors."""
+    exc = future.exception()
+    if exc is not None:
+        logger.warning("Debug report failed: %s", exc)
+
+
 def generate_debug_report(
     capture: PersonCapture,
     scored_frames: List[Tuple[int, np.ndarray, QualityScore]],
@@ -261,7 +420,7 @@ def generate_debug_report(
     with open(report_path, 'w') as f:
         f.write(md)
     
-    logger.debug(f"Debug report saved: {report_path}")
+    logger.debug("Debug report saved: %s", report_path)
     
     # Also save best frame as image
     if cfg.DEBUG_SAVE_TOP_FRAMES and scored_frames:
@@ -269,7 +428,7 @@ def generate_debug_report(
         best_annotated = draw_face_box(best_frame, best_score.bbox, best_score.total)
         best_path = os.path.join(cfg.DEBUG_OUTPUT_DIR, f"best_{capture.session_id}.jpg")
         cv2.imwrite(best_path, best_annotated)
-        logger.debug(f"Best frame saved: {best_path}")
+        logger.debug("Best frame saved: %s", best_path)
 
 # =============================================================================
 # MAIN LOOP
@@ -280,7 +439,7 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
     Main visitor counting loop with frame quality scoring.
     
     Flow:
-    1. Fast face detection (Haar cascade)
+    1. Fast face detection (InsightFace detector)
     2. On detection: capture frames for QUALITY_CAPTURE_DURATION_SEC
     3. Score frames and select best quality
     4. Extract embedding from best frame (InsightFace)
@@ -298,11 +457,11 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
     logger.info("=" * 70)
     logger.info("VISITOR COUNTER (with Frame Quality Scoring)")
     logger.info("=" * 70)
-    logger.info(f"Camera: {camera_display}")
-    logger.info(f"Similarity threshold: {cfg.SIMILARITY_THRESHOLD}")
-    logger.info(f"Cooldown: {cfg.COOLDOWN_SECONDS}s")
-    logger.info(f"Quality capture: {cfg.QUALITY_CAPTURE_DURATION_SEC}s, every {cfg.QUALITY_FRAME_SKIP} frame")
-    logger.info(f"Debug mode: {cfg.DEBUG_MODE}")
+    logger.info("Camera: %s", camera_display)
+    logger.info("Similarity threshold: %s", cfg.SIMILARITY_THRESHOLD)
+    logger.info("Cooldown: %ss", cfg.COOLDOWN_SECONDS)
+    logger.info("Quality capture: %ss, every %d frame", cfg.QUALITY_CAPTURE_DURATION_SEC, cfg.QUALITY_FRAME_SKIP)
+    logger.info("Debug mode: %s", cfg.DEBUG_MODE)
     logger.info("Press Ctrl+C to stop")
     logger.info("=" * 70)
     
@@ -311,7 +470,7 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
     get_face_analyzer()
     
     # Initialize API client (required for server-side matching)
-    logger.info(f"Connecting to API: {cfg.API_BASE_URL}")
+    logger.info("Connecting to API: %s", cfg.API_BASE_URL)
     api = init_api(
         base_url=cfg.API_BASE_URL,
         api_key=cfg.API_KEY,
@@ -325,12 +484,19 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
     
     # Connect to camera
     logger.info("Connecting to camera...")
-    # Use TCP transport for more stable RTSP connection
-    if isinstance(camera_source, str) and camera_source.startswith("rtsp://"):
-        # Set RTSP transport to TCP (more reliable than UDP)
-        os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp"
-    cap = cv2.VideoCapture(camera_source)
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    cap = None
+    if isinstance(camera_source, str) and cfg.RTSP_SUBSTREAM_URL:
+        # Prefer the substream if it already is at (or below) processing size
+        cap = open_camera(cfg.RTSP_SUBSTREAM_URL)
+        sub_width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+        if cap.isOpened() and 0 < sub_width <= cfg.TARGET_WIDTH:
+            camera_source = cfg.RTSP_SUBSTREAM_URL
+            logger.info("Using substream (%.0fpx wide, no resize needed)", sub_width)
+        else:
+            cap.release()
+            cap = None
+    if cap is None:
+        cap = open_camera(camera_source)
     
     if not cap.isOpened():
         logger.error("Cannot connect to camera")
@@ -343,17 +509,23 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
     
     frame_resized = resize_frame(frame, cfg.TARGET_WIDTH)
     h, w = frame_resized.shape[:2]
-    logger.info(f"Original resolution: {frame.shape[1]}x{frame.shape[0]}")
-    logger.info(f"Processing resolution: {w}x{h}")
+    logger.info("Original resolution: %dx%d", frame.shape[1], frame.shape[0])
+    logger.info("Processing resolution: %dx%d", w, h)
     
     logger.info("\nVisitor counting started. Waiting for faces...")
     
-    frame_count = 0
+    reader = FrameReader(cap)
+    last_seq = 0
     last_capture_time = 0
+    last_returning_report = 0.0
+    
+    # Debug reports (JPEG/base64 encoding + disk writes) run off the main loop
+    io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="debug-io")
     
     # Timing stats
-    timing_stats = {'detection': [], 'capture': [], 'scoring': [], 'recognition': [], 'total': []}
-    stats_window = 100
+    # Rolling window of the last 100 detections per stage
+    timing_stats = {key: deque(maxlen=100)
+                    for key in ('detection', 'capture', 'scoring', 'recognition', 'total')}
     
     # Session stats
     session_stats = {
@@ -366,41 +538,45 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
     
     try:
         while True:
-            ret, frame = cap.read()
+            # Sleep through the cooldown instead of waking up for every Nth
+            # frame just to compare timestamps; the reader keeps the stream
+            # drained meanwhile, so the next read returns a fresh frame
+            remaining = cfg.COOLDOWN_SECONDS - (time.time() - last_capture_time)
+            if remaining > 0:
+                time.sleep(remaining)
+            
+            # Skip frames for performance: wait for the Nth frame after the
+            # last one processed (the reader drops frames while we are busy)
+            ret, frame, last_seq = reader.read(last_seq + cfg.PROCESS_EVERY_N_FRAMES - 1)
             if not ret:
                 logger.warning("Lost connection. Reconnecting...")
-                cap.release()
+                reader.stop()
                 time.sleep(2)
-                cap = cv2.VideoCapture(camera_source)
-                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                cap = open_camera(camera_source)
+                reader = FrameReader(cap)
+                last_seq = 0
                 continue
             
-            frame_count += 1
-            
-            # Skip frames for performance
-            if frame_count % cfg.PROCESS_EVERY_N_FRAMES != 0:
-                continue
-            
-            # Check cooldown BEFORE processing
-            current_time = time.time()
-            if current_time - last_capture_time < cfg.COOLDOWN_SECONDS:
-                continue
-            
-            # Resize for processing
-            frame_resized = resize_frame(frame, cfg.TARGET_WIDTH)
-            
             # =================================================================
-            # PHASE 1: Fast face detection (Haar cascade)
+            # PHASE 1: Fast face detection (InsightFace detector)
             # =================================================================
+            # One antialiased resize straight to the detector's input width;
+            # the detector's own letterbox resize is then a no-op. Most frames
+            # have no face, so the processing-size frame is only made on a hit
             t0 = time.perf_counter()
-            face_bbox = detect_face(frame_resized)
+            det_frame = resize_frame(frame, DET_SIZE[0])
+            face = detect_largest_face(det_frame)
             detection_time = (time.perf_counter() - t0) * 1000
             timing_stats['detection'].append(detection_time)
             
-            if face_bbox is None:
+            if face is None:
                 continue  # No face detected, keep scanning
             
-            logger.info(f"Face detected! Starting capture...")
+            # Resize for processing (no-op when the stream is already small enough)
+            frame_resized = resize_frame(frame, cfg.TARGET_WIDTH)
+            face = scale_face(face, frame_resized.shape[1] / det_frame.shape[1])
+            
+            logger.info("Face detected! Starting capture...")
             session_stats['total_detections'] += 1
             
             # =================================================================
@@ -408,11 +584,12 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
             # =================================================================
             t0 = time.perf_counter()
             capture = capture_frames_for_person(
-                cap=cap,
+                reader=reader,
                 trigger_frame=frame_resized,
                 duration=cfg.QUALITY_CAPTURE_DURATION_SEC,
                 frame_skip=cfg.QUALITY_FRAME_SKIP,
-                target_width=cfg.TARGET_WIDTH
+                target_width=cfg.TARGET_WIDTH,
+                trigger_face=face
             )
             capture_time = (time.perf_counter() - t0) * 1000
             timing_stats['capture'].append(capture_time)
@@ -427,25 +604,26 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
             timing_stats['scoring'].append(scoring_time)
             session_stats['frames_scored'] += len(scored_frames)
             
-            logger.info(f"Best frame score: {best_score.total:.0f}/1000 "
-                        f"(sharp={best_score.sharpness:.2f}, frontal={best_score.frontality:.2f}, "
-                        f"size={best_score.face_size:.2f}, yaw={best_score.yaw:.1f}°)")
+            logger.info("Best frame score: %.0f/1000 (sharp=%.2f, frontal=%.2f, size=%.2f, yaw=%.1f°)",
+                        best_score.total, best_score.sharpness, best_score.frontality,
+                        best_score.face_size, best_score.yaw)
             
             # =================================================================
             # QUALITY GATE 1: Check minimum quality score
             # =================================================================
             if best_score.total < cfg.MIN_QUALITY_SCORE:
-                logger.warning(f"Quality score {best_score.total:.0f} below threshold "
-                              f"{cfg.MIN_QUALITY_SCORE:.0f} - skipping recognition")
+                logger.warning("Quality score %.0f below threshold %.0f - skipping recognition",
+                               best_score.total, cfg.MIN_QUALITY_SCORE)
                 
                 if debug_mode and scored_frames:
-                    generate_debug_report(
+                    io_pool.submit(
+                        generate_debug_report,
                         capture=capture,
                         scored_frames=scored_frames,
                         best_score=best_score,
                         visitor_result="LOW_QUALITY",
                         visitor_id=0
-                    )
+                    ).add_done_callback(_log_io_error)
                 
                 last_capture_time = time.time()
                 continue
@@ -463,13 +641,14 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
                 
                 # Still generate debug report for analysis
                 if debug_mode and scored_frames:
-                    generate_debug_report(
+                    io_pool.submit(
+                        generate_debug_report,
                         capture=capture,
                         scored_frames=scored_frames,
                         best_score=best_score,
                         visitor_result="NO_FACE",
                         visitor_id=0
-                    )
+                    ).add_done_callback(_log_io_error)
                 
                 last_capture_time = time.time()
                 continue
@@ -481,17 +660,18 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
             # QUALITY GATE 2: Check InsightFace detection confidence
             # =================================================================
             if det_score < cfg.MIN_DETECTION_SCORE:
-                logger.warning(f"Detection confidence {det_score:.3f} below threshold "
-                              f"{cfg.MIN_DETECTION_SCORE} - skipping API call")
+                logger.warning("Detection confidence %.3f below threshold %s - skipping API call",
+                               det_score, cfg.MIN_DETECTION_SCORE)
                 
                 if debug_mode and scored_frames:
-                    generate_debug_report(
+                    io_pool.submit(
+                        generate_debug_report,
                         capture=capture,
                         scored_frames=scored_frames,
                         best_score=best_score,
                         visitor_result=f"LOW_CONFIDENCE ({det_score:.2f})",
                         visitor_id=0
-                    )
+                    ).add_done_callback(_log_io_error)
                 
                 last_capture_time = time.time()
                 continue
@@ -500,37 +680,46 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
             # PHASE 5: Send to server for identification
             # =================================================================
             # Server performs matching and decides new vs returning
-            logger.debug(f"Detection confidence: {det_score:.3f}")
-            api_response = api.identify(embedding, best_frame)
+            logger.debug("Detection confidence: %.3f", det_score)
+            api_response = api.identify(embedding, best_frame, bbox=bbox)
             
             if api_response.success:
                 visitor_id = api_response.customer_id
                 
                 if api_response.status == "returning":
                     visitor_result = "RETURNING"
-                    logger.info(f"  → RETURNING visitor #{visitor_id} "
-                               f"(similarity: {api_response.similarity:.3f}, "
-                               f"visit #{api_response.visit_count})")
+                    logger.info("  → RETURNING visitor #%s (similarity: %.3f, visit #%s)",
+                                visitor_id, api_response.similarity, api_response.visit_count)
                     session_stats['returning_visitors'] += 1
                 else:
                     visitor_result = "NEW"
-                    logger.info(f"  → NEW visitor #{visitor_id} enrolled")
+                    logger.info("  → NEW visitor #%s enrolled", visitor_id)
                     session_stats['new_visitors'] += 1
             else:
                 visitor_result = "ERROR"
                 visitor_id = 0
-                logger.error(f"  → API error: {api_response.message}")
+                logger.error("  → API error: %s", api_response.message)
             
             # =================================================================
-            # DEBUG: Generate report if enabled
+            # DEBUG: Generate report if enabled (new visitors and errors
+            # always; repeat traffic only as an occasional sample)
             # =================================================================
-            generate_debug_report(
-                capture=capture,
-                scored_frames=scored_frames,
-                best_score=best_score,
-                visitor_result=visitor_result,
-                visitor_id=visitor_id
-            )
+            write_report = cfg.DEBUG_MODE
+            if write_report and visitor_result == "RETURNING":
+                now = time.time()
+                write_report = now - last_returning_report >= cfg.DEBUG_RETURNING_INTERVAL_SEC
+                if write_report:
+                    last_returning_report = now
+            
+            if write_report:
+                io_pool.submit(
+                    generate_debug_report,
+                    capture=capture,
+                    scored_frames=scored_frames,
+                    best_score=best_score,
+                    visitor_result=visitor_result,
+                    visitor_id=visitor_id
+                ).add_done_callback(_log_io_error)
             
             # Update cooldown
             last_capture_time = time.time()
@@ -539,39 +728,36 @@ def run_visitor_counter(debug_mode: bool = False) -> None:
             total_time = detection_time + capture_time + scoring_time + recognition_time
             timing_stats['total'].append(total_time)
             
-            # Trim timing stats
-            for key in timing_stats:
-                if len(timing_stats[key]) > stats_window:
-                    timing_stats[key] = timing_stats[key][-stats_window:]
-            
             # Log current stats
-            logger.debug(f"  Timing: detect={detection_time:.0f}ms, capture={capture_time:.0f}ms, "
-                        f"score={scoring_time:.0f}ms, recog={recognition_time:.0f}ms")
+            logger.debug("  Timing: detect=%.0fms, capture=%.0fms, score=%.0fms, recog=%.0fms",
+                         detection_time, capture_time, scoring_time, recognition_time)
                 
     except KeyboardInterrupt:
         logger.info("\nStopping visitor counter...")
     finally:
-        cap.release()
+        reader.stop()
+        api.close()
+        io_pool.shutdown(wait=True)  # Let pending debug reports finish
         
         # Final summary
         logger.info("\n" + "=" * 70)
         logger.info("SESSION SUMMARY")
         logger.info("=" * 70)
-        logger.info(f"Total face detections: {session_stats['total_detections']}")
-        logger.info(f"New visitors enrolled: {session_stats['new_visitors']}")
-        logger.info(f"Returning visitors:    {session_stats['returning_visitors']}")
-        logger.info(f"Frames captured:       {session_stats['frames_captured']}")
-        logger.info(f"Frames scored:         {session_stats['frames_scored']}")
+        logger.info("Total face detections: %d", session_stats['total_detections'])
+        logger.info("New visitors enrolled: %d", session_stats['new_visitors'])
+        logger.info("Returning visitors:    %d", session_stats['returning_visitors'])
+        logger.info("Frames captured:       %d", session_stats['frames_captured'])
+        logger.info("Frames scored:         %d", session_stats['frames_scored'])
         
         total_visitors = session_stats['new_visitors'] + session_stats['returning_visitors']
-        logger.info(f"\nTotal visitors this session: {total_visitors}")
+        logger.info("\nTotal visitors this session: %d", total_visitors)
         
-        if timing_stats['total']:
+        if timing_stats['total'] and logger.isEnabledFor(logging.INFO):
             logger.info("\nTIMING (averages):")
             for key in ['detection', 'capture', 'scoring', 'recognition', 'total']:
                 if timing_stats[key]:
                     avg = sum(timing_stats[key]) / len(timing_stats[key])
-                    logger.info(f"  {key.capitalize():12}: {avg:.1f} ms")
+                    logger.info("  %-12s: %.1f ms", key.capitalize(), avg)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Visitor Counter with Frame Quality Scoring")
@@ -585,6 +771,6 @@ if __name__ == "__main__":
     
     if args.debug:
         cfg.DEBUG_MODE = True
-        logger.info(f"Debug mode enabled: saving to {cfg.DEBUG_OUTPUT_DIR}")
+        logger.info("Debug mode enabled: saving to %s", cfg.DEBUG_OUTPUT_DIR)
     
     run_visitor_counter(debug_mode=args.debug)